@@ -1,23 +1,87 @@
 import asyncio
 import csv
+import hashlib
 import logging
+import math
+import mmap
 import os
-import json
+import re
+import struct
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from dataclasses import dataclass
+from itertools import islice
+from string import Formatter
+import orjson
 from telethon import TelegramClient
 from telethon.errors import (
     FloodWaitError, 
     UserPrivacyRestrictedError, 
     UserNotMutualContactError,
     PeerIdInvalidError,
-    ChatWriteForbiddenError
+    ChatWriteForbiddenError,
+    SlowModeWaitError
 )
-from telethon.tl.types import User
+from telethon.tl.functions.updates import GetStateRequest
+from telethon.tl.functions.users import GetUsersRequest
+from telethon.tl.types import User, InputPeerUser, InputUser
+
+try:
+    import polars as pl  # Optional: multithreaded parsing of large user lists
+except ImportError:
+    pl = None
+
+# Errors after which a user is skipped: (recorded error, log reason)
+SKIP_ERRORS = {
+    UserPrivacyRestrictedError: ('Privacy settings prevent messaging', 'Privacy restricted'),
+    UserNotMutualContactError: ('Privacy settings prevent messaging', 'Privacy restricted'),
+    PeerIdInvalidError: ('Invalid peer or messaging forbidden', 'Invalid peer'),
+    ChatWriteForbiddenError: ('Invalid peer or messaging forbidden', 'Invalid peer'),
+}
+SKIP_ERROR_TYPES = tuple(SKIP_ERRORS)
+# Errors carrying a wait in seconds after which the send is retried
+WAIT_ERROR_TYPES = (FloodWaitError, SlowModeWaitError)
+
+# @username (or bare username) or phone number; anything else cannot resolve
+USER_PATTERN = re.compile(r'^(?:@?[A-Za-z][A-Za-z0-9_]{3,31}|\+?\d{5,15})$')
+# t.me/<name> links and the separators people type into phone numbers
+TME_LINK = re.compile(r'^(?:https?://)?(?:www\.)?t(?:elegram)?\.me/@?(\w+)/?$', re.IGNORECASE)
+PHONE_SEPARATORS = re.compile(r'[\s().-]')
+
+
+def normalize_user(value: str) -> str:
+    """Unwrap t.me links to @username and strip separators from phone numbers"""
+    link = TME_LINK.match(value)
+    if link:
+        return '@' + link.group(1)
+    if value[:1] in '+(' or value[:1].isdigit():
+        return PHONE_SEPARATORS.sub('', value)
+    return value
+
+# Append-only progress journals, one JSON record per line
+SENT_JOURNAL = 'data/sent_users.jsonl'
+FAILED_JOURNAL = 'data/failed_users.jsonl'
+USERS_CSV = 'data/users.csv'
+# Bloom filter of every journaled user, checked when resuming
+PROCESSED_FILTER = 'data/processed.bf'
+# Sorted list of processed users, searched in place to confirm filter hits
+PROCESSED_INDEX = 'data/processed.sorted'
+# Resolved users (id + access_hash) so resumed runs can skip get_entity
+ENTITY_CACHE = 'data/entity_cache.json'
+
+# Environment, read once at import
+TELEGRAM_API_ID = os.getenv('TELEGRAM_API_ID', '0')
+TELEGRAM_API_HASH = os.getenv('TELEGRAM_API_HASH', '')
+TELEGRAM_PHONE = os.getenv('TELEGRAM_PHONE', '')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
 
 # Configuration
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Config:
     api_id: int
     api_hash: str
@@ -25,7 +89,168 @@ class Config:
     session_name: str = "bulk_sender"
     message_delay: int = 60  # seconds between messages
     max_retries: int = 3
-    batch_size: int = 100  # Process users in batches
+    batch_size: int = 100  # Users resolved per GetUsersRequest
+    workers: int = 4  # concurrent senders sharing the rate limit
+    burst: int = 1  # messages an idle limiter may release back to back
+    keepalive_after: float = 30.0  # idle seconds before the connection is pinged
+    filter_capacity: int = 1_000_000  # users the processed filter is sized for
+    filter_error_rate: float = 0.001  # chance a new user is mistaken for processed
+
+@dataclass(slots=True)
+class SendResult:
+    """Outcome of one send; each worker reuses a single instance"""
+    user: str
+    status: str = 'failed'
+    error: Optional[str] = None
+    ts: float = 0.0  # time.time(), formatted when journaled
+
+    def reset(self, user: str):
+        self.user = user
+        self.status = 'failed'
+        self.error = None
+        self.ts = time.time()
+
+class BloomFilter:
+    """Bloom filter persisted in a memory-mapped file"""
+    HEADER = struct.Struct('<QQQ')  # bit count, hash count, items added
+
+    def __init__(self, path: str, capacity: int, error_rate: float):
+        # Set when the file was missing or damaged and the filter starts out empty
+        self.created = not self._load(path)
+        if self.created:
+            self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+            self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+            self.count = 0
+            self._file = open(path, 'w+b')
+            self._file.write(self.HEADER.pack(self.num_bits, self.num_hashes, self.count))
+            self._file.truncate(self.HEADER.size + (self.num_bits + 7) // 8)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def _load(self, path: str) -> bool:
+        """Open an existing filter file, rejecting one with a bad header or size"""
+        if not os.path.exists(path):
+            return False
+        f = open(path, 'r+b')
+        header = f.read(self.HEADER.size)
+        if len(header) == self.HEADER.size:
+            num_bits, num_hashes, count = self.HEADER.unpack(header)
+            size = os.fstat(f.fileno()).st_size
+            if num_bits and num_hashes and size == self.HEADER.size + (num_bits + 7) // 8:
+                self._file = f
+                self.num_bits, self.num_hashes, self.count = num_bits, num_hashes, count
+                return True
+        f.close()
+        return False
+
+    def _positions(self, item: str) -> Iterator[int]:
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._map[self.HEADER.size + (pos >> 3)] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._map[self.HEADER.size + (pos >> 3)] & (1 << (pos & 7))
+            for pos in self._positions(item)
+        )
+
+    def close(self):
+        self._map[:self.HEADER.size] = self.HEADER.pack(self.num_bits, self.num_hashes, self.count)
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+class SortedIndex:
+    """Sorted newline-separated file searched with a binary search over mmap"""
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __contains__(self, item: str) -> bool:
+        key = item.encode('utf-8')
+        data = self._map
+        lo, hi = 0, len(data)
+        # lo and hi always sit on line boundaries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind(b'\n', 0, mid) + 1
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = len(data)
+            line = data[start:end]
+            if line == key:
+                return True
+            if line < key:
+                lo = end + 1
+            else:
+                hi = start
+        return False
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+class RateLimiter:
+    """Hands out monotonic send slots shared by all workers to pace outgoing messages"""
+    def __init__(self, interval: float, burst: int):
+        self.interval = interval  # seconds between slots
+        self.burst = burst
+        self.next_slot = 0.0
+
+    async def acquire(self):
+        """Reserve the next send slot and sleep only for what is left of it"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        # An idle limiter lets up to `burst` slots start immediately
+        slot = max(self.next_slot, now - (self.burst - 1) * self.interval)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+_FORMATTER = Formatter()
+
+class MessageTemplate:
+    """Message template parsed once at load time and rendered per user"""
+    # Placeholders available in data/message.txt, e.g. "Hi {first_name}"
+    FIELDS = ('user', 'first_name', 'last_name', 'username')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = tuple(_FORMATTER.parse(text))
+        names = {name for _, name, _, _ in self.parts if name is not None}
+        unknown = names - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown placeholders: {', '.join(sorted(unknown))}")
+        # Without placeholders every user gets the same (unescaped) text
+        self.static = None if names else ''.join(literal for literal, _, _, _ in self.parts)
+        # Every field renders as a string, so a bad format spec fails here rather than per send
+        self.render('', None)
+
+    def render(self, user_identifier: str, user_entity: Optional[User]) -> str:
+        """Fill the placeholders from the CSV identifier and the resolved user"""
+        if self.static is not None:
+            return self.static
+        out = []
+        for literal, name, spec, conversion in self.parts:
+            out.append(literal)
+            if name is None:
+                continue
+            if name == 'user':
+                value = user_identifier
+            else:
+                value = getattr(user_entity, name, None) or ''
+            if conversion:
+                value = _FORMATTER.convert_field(value, conversion)
+            out.append(format(value, spec))
+        return ''.join(out)
 
 class TelegramBulkSender:
     def __init__(self, config: Config):
@@ -42,60 +267,203 @@ class TelegramBulkSender:
             'skipped': 0,
             'total': 0
         }
+        self._entity_cache: Dict[str, Optional[User]] = {}
+        self._t0 = time.monotonic()  # start of the current run
+        self._last_rpc = 0.0  # loop time of the last request to Telegram
+        self._reported_invalid = set()  # CSV files whose malformed rows were logged
+        # File writes run on worker threads; this keeps them from interleaving
+        self._io_lock = threading.Lock()
+        # Cleared while a FloodWaitError pause is in effect
+        self._not_paused = asyncio.Event()
+        self._not_paused.set()
+        self._paused_until = 0.0
+        # Handlers for errors carrying a wait in seconds, keyed by error type
+        self.wait_handlers = {
+            FloodWaitError: self.handle_flood_wait,
+            SlowModeWaitError: self.handle_slow_mode_wait,
+        }
+        # Send slots shared by every worker and every retry
+        self.limiter = RateLimiter(config.message_delay, config.burst)
         
     def setup_logging(self):
         """Setup logging configuration"""
+        # Handlers run on the listener's thread so disk/TTY writes never block the event loop
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        handlers = [
+            logging.FileHandler('logs/telegram_bulk.log'),
+            logging.StreamHandler()
+        ]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        log_queue = SimpleQueue()
+        self.log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.log_listener.start()
+        
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.setFormatter(logging.Formatter('%(message)s'))
         logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('logs/telegram_bulk.log'),
-                logging.StreamHandler()
-            ]
+            level=LOG_LEVEL,
+            handlers=[queue_handler]
         )
         self.logger = logging.getLogger(__name__)
 
-    def load_users_from_csv(self, file_path: str) -> List[str]:
-        """Load user IDs/usernames from CSV file"""
-        users = []
+    def iter_users_from_csv(self, file_path: str) -> Iterator[str]:
+        """Stream user IDs/usernames from CSV file, dropping malformed ones"""
+        invalid = 0
+        report = file_path not in self._reported_invalid
+        for raw in self.read_users(file_path):
+            user = normalize_user(raw)
+            if USER_PATTERN.match(user):
+                yield user
+            else:
+                invalid += 1
+                if report:
+                    self.logger.debug("Skipping malformed user identifier %r", raw)
+        if invalid and report:
+            self._reported_invalid.add(file_path)
+            self.logger.warning(f"Skipped {invalid} malformed user identifiers in {file_path}")
+
+    def read_users(self, file_path: str) -> Iterator[str]:
+        """Stream the raw first-column values of the CSV file"""
+        if pl is not None:
+            try:
+                users = self.read_user_column(file_path)
+            except Exception as e:
+                self.logger.warning(f"polars could not read {file_path}, falling back to csv: {e}")
+            else:
+                yield from users
+                return
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
                 reader = csv.reader(file)
-                next(reader)  # Skip header
+                next(reader, None)  # Skip header
                 for row in reader:
                     if row and row[0].strip():
-                        users.append(row[0].strip())
-            self.logger.info(f"Loaded {len(users)} users from {file_path}")
-            return users
+                        yield row[0].strip()
         except Exception as e:
             self.logger.error(f"Error loading users from CSV: {e}")
-            return []
 
-    def load_message_template(self, file_path: str) -> str:
+    def read_user_column(self, file_path: str) -> "pl.Series":
+        """Parse the first CSV column with polars (C-level, multithreaded)"""
+        frame = pl.read_csv(
+            file_path,
+            columns=[0],
+            infer_schema_length=0,  # keep every value as a string
+            truncate_ragged_lines=True
+        )
+        # Positional, so the header name never matters
+        users = frame.to_series(0).str.strip_chars().drop_nulls()
+        return users.filter(users != '')
+
+    def load_message_template(self, file_path: str) -> Optional[MessageTemplate]:
         """Load message template from file"""
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
-                message = file.read().strip()
+                message = MessageTemplate(file.read().strip())
             self.logger.info(f"Loaded message template from {file_path}")
-            return message
+            return message if message.text else None
         except Exception as e:
             self.logger.error(f"Error loading message template: {e}")
-            return ""
+            return None
+
+    def reset_progress(self):
+        """Discard the progress of earlier runs so a new run starts fresh"""
+        for path in (SENT_JOURNAL, FAILED_JOURNAL, PROCESSED_FILTER, PROCESSED_INDEX,
+                     'data/sent_users.json', 'data/failed_users.json'):
+            if os.path.exists(path):
+                os.remove(path)
 
-    def save_progress(self, sent_users: List[str], failed_users: List[Dict]):
-        """Save progress to JSON files"""
+    def open_journal(self):
+        """Open the append-only progress journals"""
+        self._journals = {
+            'sent': open(SENT_JOURNAL, 'ab+'),
+            'failed': open(FAILED_JOURNAL, 'ab+'),
+        }
+        # End a line torn by a crash so appends never land on it; reads skip it
+        for f in self._journals.values():
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        self._journal_dirty = False
+
+    def record_progress(self, result: SendResult):
+        """Append a single result to its journal and flush it to disk"""
         try:
-            # Save sent users
-            with open('data/sent_users.json', 'w') as f:
-                json.dump(sent_users, f, indent=2)
-            
-            # Save failed users
-            with open('data/failed_users.json', 'w') as f:
-                json.dump(failed_users, f, indent=2)
-                
-            self.logger.info("Progress saved successfully")
+            record = {
+                'user': result.user,
+                'status': result.status,
+                'error': result.error,
+                'timestamp': datetime.fromtimestamp(result.ts).isoformat()
+            }
+            f = self._journals['sent' if result.status == 'sent' else 'failed']
+            with self._io_lock:
+                f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+                f.flush()
+                os.fsync(f.fileno())
+                self._journal_dirty = True
+        except Exception as e:
+            self.logger.error("Error saving progress: %s", e)
+
+    def close_journal(self):
+        """Close the journals and compact them if this run changed them"""
+        # Waits for any record_progress thread left running by a cancelled worker
+        with self._io_lock:
+            for f in self._journals.values():
+                f.close()
+        if self._journal_dirty or not self.processed_index_is_fresh():
+            self.compact_progress()
+        self.logger.info("Progress saved successfully")
+
+    def compact_journal(self, path: str) -> Optional[Iterable[str]]:
+        """Rewrite a journal keeping the latest record per user and dropping torn lines"""
+        try:
+            records = {record['user']: record for record in self.iter_journal(path)}
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                for record in records.values():
+                    f.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+            os.replace(tmp_path, path)
+            return records.keys()
+        except Exception as e:
+            self.logger.error(f"Error compacting {path}: {e}")
+            return None
+
+    def compact_progress(self) -> bool:
+        """Compact both journals and write the sorted processed index from the same pass"""
+        users = set()
+        try:
+            for path in (SENT_JOURNAL, FAILED_JOURNAL):
+                if os.path.exists(path):
+                    compacted = self.compact_journal(path)
+                    if compacted is None:
+                        raise RuntimeError(f"could not compact {path}")
+                    users.update(user.encode('utf-8') for user in compacted)
+            sent_users, failed_users = self.read_legacy_progress()
+            users.update(user.encode('utf-8') for user in sent_users)
+            users.update(failed['user'].encode('utf-8') for failed in failed_users)
+            tmp_path = PROCESSED_INDEX + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.writelines(user + b'\n' for user in sorted(users))
+            os.replace(tmp_path, PROCESSED_INDEX)
+            return True
         except Exception as e:
-            self.logger.error(f"Error saving progress: {e}")
+            self.logger.error(f"Error writing processed index: {e}")
+            # Never leave a partial index behind; the next run rebuilds it
+            if os.path.exists(PROCESSED_INDEX):
+                os.remove(PROCESSED_INDEX)
+            return False
+
+    def iter_journal(self, path: str) -> Iterator[Dict]:
+        """Stream the records of a JSONL journal, skipping a torn last line"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    self.logger.warning("Skipping corrupt line in %s", path)
 
     def load_progress(self) -> tuple:
         """Load previous progress"""
@@ -103,20 +471,67 @@ class TelegramBulkSender:
         failed_users = []
         
         try:
-            if os.path.exists('data/sent_users.json'):
-                with open('data/sent_users.json', 'r') as f:
-                    sent_users = json.load(f)
-                    
-            if os.path.exists('data/failed_users.json'):
-                with open('data/failed_users.json', 'r') as f:
-                    failed_users = json.load(f)
-                    
+            sent_users = [record['user'] for record in self.iter_journal(SENT_JOURNAL)]
+            failed_users = list(self.iter_journal(FAILED_JOURNAL))
+            legacy_sent, legacy_failed = self.load_legacy_progress()
+            sent_users.extend(legacy_sent)
+            failed_users.extend(legacy_failed)
             self.logger.info(f"Loaded progress: {len(sent_users)} sent, {len(failed_users)} failed")
         except Exception as e:
             self.logger.error(f"Error loading progress: {e}")
             
         return sent_users, failed_users
 
+    def load_legacy_progress(self) -> tuple:
+        """Load progress written by older versions as whole-file JSON"""
+        try:
+            return self.read_legacy_progress()
+        except Exception as e:
+            self.logger.error(f"Error loading legacy progress: {e}")
+            return [], []
+
+    def read_legacy_progress(self) -> tuple:
+        """Read the legacy whole-file JSON progress, raising on a bad file"""
+        sent_users = []
+        failed_users = []
+        if os.path.exists('data/sent_users.json'):
+            with open('data/sent_users.json', 'rb') as f:
+                sent_users = orjson.loads(f.read())
+                
+        if os.path.exists('data/failed_users.json'):
+            with open('data/failed_users.json', 'rb') as f:
+                failed_users = orjson.loads(f.read())
+        return sent_users, failed_users
+
+    def open_processed_filter(self) -> BloomFilter:
+        """Open the processed-user filter, rebuilding it from the journals when missing"""
+        processed_users = BloomFilter(PROCESSED_FILTER, self.config.filter_capacity, self.config.filter_error_rate)
+        if processed_users.created:
+            sent_users, failed_users = self.load_progress()
+            for user in sent_users:
+                processed_users.add(user)
+            for failed in failed_users:
+                processed_users.add(failed['user'])
+        return processed_users
+
+    def processed_index_is_fresh(self) -> bool:
+        """Whether the processed index was written after the journals last changed"""
+        if not os.path.exists(PROCESSED_INDEX):
+            return False
+        journal_mtime = max(
+            (os.path.getmtime(path) for path in (SENT_JOURNAL, FAILED_JOURNAL) if os.path.exists(path)),
+            default=0
+        )
+        return os.path.getmtime(PROCESSED_INDEX) >= journal_mtime
+
+    def open_processed_index(self) -> SortedIndex:
+        """Open the processed index, rebuilding it when the journals are newer"""
+        if not self.processed_index_is_fresh():
+            # Stale after a crash, or never written: rebuild from the journals
+            if not self.compact_progress():
+                raise RuntimeError("Could not rebuild the processed index; refusing to resume")
+        return SortedIndex(PROCESSED_INDEX)
+
     async def validate_user(self, user_identifier: str) -> Optional[User]:
         """Validate if user exists and can be messaged"""
         try:
@@ -126,157 +541,346 @@ class TelegramBulkSender:
                 return user_entity
             return None
         except Exception as e:
-            self.logger.debug(f"Could not validate user {user_identifier}: {e}")
+            self.logger.debug("Could not validate user %s: %s", user_identifier, e)
             return None
 
-    async def send_message_with_retry(self, user_identifier: str, message: str) -> Dict:
-        """Send message with retry logic and error handling"""
-        result = {
-            'user': user_identifier,
-            'status': 'failed',
-            'error': None,
-            'timestamp': datetime.now().isoformat()
+    async def resolve_user(self, user_identifier: str) -> Optional[User]:
+        """Validate a user, reusing the cached result when it was resolved before"""
+        if user_identifier not in self._entity_cache:
+            # Lookups are flood-limited too, so none go out during a flood pause
+            await self._not_paused.wait()
+        if user_identifier in self._entity_cache:
+            return self._entity_cache[user_identifier]
+        user_entity = await self.validate_user(user_identifier)
+        self._last_rpc = asyncio.get_running_loop().time()
+        # Invalid users are cached too so they are skipped without another lookup
+        self._entity_cache[user_identifier] = user_entity
+        return user_entity
+
+    async def prefetch_entities(self, identifiers: List[str]):
+        """Resolve users already known to the session with batched GetUsersRequest calls"""
+        pending = []
+        for identifier in identifiers:
+            if identifier in self._entity_cache:
+                continue
+            try:
+                # Local session lookup only; unknown users are resolved one by one later
+                input_peer = self.client.session.get_input_entity(identifier)
+            except (ValueError, TypeError):
+                continue
+            if isinstance(input_peer, InputPeerUser):
+                pending.append((identifier, InputUser(user_id=input_peer.user_id, access_hash=input_peer.access_hash)))
+                
+        batch_size = self.config.batch_size
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i:i + batch_size]
+            await self._not_paused.wait()
+            try:
+                users = await self.client(GetUsersRequest(id=[input_user for _, input_user in batch]))
+            except Exception as e:
+                self.logger.debug("Could not prefetch %d users: %s", len(batch), e)
+                continue
+            by_id = {user.id: user for user in users if isinstance(user, User)}
+            for identifier, input_user in batch:
+                if input_user.user_id in by_id:
+                    self._entity_cache[identifier] = by_id[input_user.user_id]
+
+    def save_entity_cache(self):
+        """Persist the resolved entities needed to address users again"""
+        # Called once the workers have stopped, so the cache no longer changes
+        cache = {
+            identifier: {
+                'id': entity.id,
+                'access_hash': entity.access_hash,
+                'username': entity.username,
+                'first_name': entity.first_name,
+                'last_name': entity.last_name
+            }
+            for identifier, entity in self._entity_cache.items()
+            if entity is not None and entity.access_hash is not None
         }
+        try:
+            # Replace atomically so a crash never leaves a truncated cache behind
+            tmp_path = ENTITY_CACHE + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(cache))
+            os.replace(tmp_path, ENTITY_CACHE)
+        except Exception as e:
+            self.logger.error(f"Error saving entity cache: {e}")
+
+    def load_entity_cache(self):
+        """Rehydrate entities cached by a previous run"""
+        if not os.path.exists(ENTITY_CACHE):
+            return
+        try:
+            with open(ENTITY_CACHE, 'rb') as f:
+                cache = orjson.loads(f.read())
+            # A User carrying its access_hash is sent to without another resolve
+            for identifier, fields in cache.items():
+                self._entity_cache.setdefault(identifier, User(**fields))
+            self.logger.info(f"Loaded {len(cache)} cached entities")
+        except Exception as e:
+            self.logger.error(f"Error loading entity cache: {e}")
+
+    async def keep_alive(self):
+        """Ping Telegram whenever the connection sits idle, so no send has to wait for a reconnect"""
+        loop = asyncio.get_running_loop()
+        while True:
+            idle = loop.time() - self._last_rpc
+            if idle < self.config.keepalive_after:
+                await asyncio.sleep(self.config.keepalive_after - idle)
+                continue
+            await self._not_paused.wait()  # Nothing goes out during a flood pause
+            self._last_rpc = loop.time()
+            try:
+                await self.client(GetStateRequest())
+            except Exception as e:
+                self.logger.debug("Keepalive failed: %s", e)
+
+    async def wait_for_flood(self, seconds: int):
+        """Pause every worker until Telegram's flood wait has elapsed"""
+        loop = asyncio.get_running_loop()
+        self._paused_until = max(self._paused_until, loop.time() + seconds)
+        self._not_paused.clear()
+        # No slot handed out from now on may fall inside the pause
+        self.limiter.next_slot = max(self.limiter.next_slot, self._paused_until)
+        while (remaining := self._paused_until - loop.time()) > 0:
+            await asyncio.sleep(remaining)
+        self._not_paused.set()
+
+    async def handle_flood_wait(self, user_identifier: str, seconds: int):
+        """Account-wide limit: every worker has to back off"""
+        self.logger.warning("Rate limit hit. Pausing all workers for %d seconds...", seconds)
+        await self.wait_for_flood(seconds)
+
+    async def handle_slow_mode_wait(self, user_identifier: str, seconds: int):
+        """Per-chat limit: only the worker that hit it waits"""
+        self.logger.warning("Slow mode for %s. Waiting %d seconds...", user_identifier, seconds)
+        await asyncio.sleep(seconds)
+
+    async def wait_for_send_slot(self):
+        """Wait out any flood pause and then for a send slot, again if a pause began meanwhile"""
+        while True:
+            await self._not_paused.wait()
+            await self.limiter.acquire()
+            if self._not_paused.is_set():
+                return
+
+    async def send_message_with_retry(self, user_identifier: str, message: MessageTemplate,
+                                      result: Optional[SendResult] = None) -> SendResult:
+        """Send message with retry logic and error handling"""
+        if result is None:
+            result = SendResult(user_identifier)
+        result.reset(user_identifier)
+        
+        # Validate user first; retries below can reuse the entity and text as-is
+        user_entity = await self.resolve_user(user_identifier)
+        if not user_entity:
+            result.error = 'User not found or invalid'
+            result.status = 'skipped'
+            return result
+        try:
+            text = message.render(user_identifier, user_entity)
+        except Exception as e:
+            result.error = str(e)
+            self.stats['failed'] += 1
+            self.logger.error("✗ Error rendering message for %s: %s", user_identifier, e)
+            return result
         
-        for attempt in range(self.config.max_retries):
+        max_retries = self.config.max_retries
+        for attempt in range(max_retries):
+            # Retries take a fresh slot; the first attempt re-waits only if a pause started
+            if attempt or not self._not_paused.is_set():
+                await self.wait_for_send_slot()
             try:
-                # Validate user first
-                user_entity = await self.validate_user(user_identifier)
-                if not user_entity:
-                    result['error'] = 'User not found or invalid'
-                    result['status'] = 'skipped'
-                    return result
-                
-                # Send message
-                await self.client.send_message(user_entity, message)
-                result['status'] = 'sent'
-                result['error'] = None
+                await self.client.send_message(user_entity, text)
+                result.status = 'sent'
+                result.error = None
                 self.stats['sent'] += 1
-                self.logger.info(f"✓ Message sent to {user_identifier}")
+                self.logger.info("✓ Message sent to %s", user_identifier)
                 return result
                 
-            except FloodWaitError as e:
-                wait_time = e.seconds
-                self.logger.warning(f"Rate limit hit. Waiting {wait_time} seconds...")
-                await asyncio.sleep(wait_time)
+            except WAIT_ERROR_TYPES as e:
+                await self.wait_handlers[type(e)](user_identifier, e.seconds)
                 continue
                 
-            except (UserPrivacyRestrictedError, UserNotMutualContactError):
-                result['error'] = 'Privacy settings prevent messaging'
-                result['status'] = 'skipped'
+            except SKIP_ERROR_TYPES as e:
+                result.error, reason = SKIP_ERRORS[type(e)]
+                result.status = 'skipped'
                 self.stats['skipped'] += 1
-                self.logger.warning(f"⚠ Cannot message {user_identifier}: Privacy restricted")
-                return result
-                
-            except (PeerIdInvalidError, ChatWriteForbiddenError):
-                result['error'] = 'Invalid peer or messaging forbidden'
-                result['status'] = 'skipped'
-                self.stats['skipped'] += 1
-                self.logger.warning(f"⚠ Cannot message {user_identifier}: Invalid peer")
+                self.logger.warning("⚠ Cannot message %s: %s", user_identifier, reason)
                 return result
                 
             except Exception as e:
-                result['error'] = str(e)
-                self.logger.error(f"✗ Error sending to {user_identifier}: {e}")
-                if attempt == self.config.max_retries - 1:
+                result.error = str(e)
+                self.logger.error("✗ Error sending to %s: %s", user_identifier, e)
+                if attempt == max_retries - 1:
                     self.stats['failed'] += 1
                     return result
                 await asyncio.sleep(5)  # Short delay before retry
                 
         return result
 
-    async def send_bulk_messages(self, users: List[str], message: str, resume: bool = False):
+    async def send_bulk_messages(self, users: Iterable[str], message: MessageTemplate, resume: bool = False, total: int = 0):
         """Main function to send bulk messages"""
-        sent_users, failed_users = [], []
-        
-        if resume:
-            sent_users, failed_users = self.load_progress()
-            # Filter out already processed users
-            processed_users = set(sent_users + [f['user'] for f in failed_users])
-            users = [user for user in users if user not in processed_users]
-            self.logger.info(f"Resuming: {len(users)} users remaining")
+        self.stats['total'] = total
         
-        self.stats['total'] = len(users)
-        
-        if not users:
+        if not total:
             self.logger.info("No users to process")
             return
+        
+        if not resume:
+            await asyncio.to_thread(self.reset_progress)
+        processed_users = await asyncio.to_thread(self.open_processed_filter)
+        processed_index = await asyncio.to_thread(self.open_processed_index) if resume else None
+        if resume:
+            self.logger.info(f"Resuming: about {processed_users.count} users already processed")
+        await asyncio.to_thread(self.load_entity_cache)
             
-        self.logger.info(f"Starting bulk messaging to {len(users)} users")
+        workers = self.config.workers
+        batch_size = self.config.batch_size
+        self.logger.info(f"Starting bulk messaging to up to {total} users with {workers} workers")
         self.logger.info(f"Rate limit: 1 message per {self.config.message_delay} seconds")
         
-        start_time = datetime.now()
-        
-        for i, user in enumerate(users, 1):
-            try:
-                self.logger.info(f"Processing {i}/{len(users)}: {user}")
-                
-                # Send message
-                result = await self.send_message_with_retry(user, message)
-                
-                if result['status'] == 'sent':
-                    sent_users.append(user)
-                elif result['status'] in ['failed', 'skipped']:
-                    failed_users.append(result)
-                
-                # Save progress every 10 messages
-                if i % 10 == 0:
-                    self.save_progress(sent_users, failed_users)
-                    self.print_stats(i, len(users), start_time)
-                
-                # Rate limiting - wait between messages
-                if i < len(users):  # Don't wait after the last message
-                    self.logger.info(f"Waiting {self.config.message_delay} seconds...")
-                    await asyncio.sleep(self.config.message_delay)
+        # Bounded so the user list is streamed rather than held in memory
+        queue = asyncio.Queue(maxsize=workers * 2)
+        processed = 0
+        self._t0 = time.monotonic()
+        self._last_rpc = asyncio.get_running_loop().time()
+
+        async def enqueue(batch: List[str]):
+            await self.prefetch_entities(batch)
+            for user in batch:
+                await queue.put(user)
+
+        rows = iter(users)
+
+        def next_chunk() -> Tuple[int, List[str]]:
+            """Read the next chunk of users and drop the already processed ones"""
+            chunk = list(islice(rows, batch_size))
+            if not resume:
+                return len(chunk), chunk
+            # The filter cheaply rules out new users; the index confirms its hits
+            return len(chunk), [
+                user for user in chunk
+                if user not in processed_users or user not in processed_index
+            ]
+
+        async def producer():
+            # Read the user stream a chunk at a time off the event loop
+            while True:
+                read, batch = await asyncio.to_thread(next_chunk)
+                if not read:
+                    break
+                self.stats['total'] -= read - len(batch)
+                await enqueue(batch)
+            for _ in range(workers):
+                await queue.put(None)  # One stop signal per worker
+
+        async def worker():
+            nonlocal processed
+            result = SendResult('')
+            while (user := await queue.get()) is not None:
+                # Resolve the user while waiting for a send slot
+                resolving = asyncio.create_task(self.resolve_user(user))
+                try:
+                    await self.wait_for_send_slot()
+                    await resolving
+                    self.logger.info("Processing %d/%d: %s", processed + 1, self.stats['total'], user)
                     
-            except KeyboardInterrupt:
-                self.logger.info("Process interrupted by user")
-                self.save_progress(sent_users, failed_users)
-                break
-            except Exception as e:
-                self.logger.error(f"Unexpected error processing {user}: {e}")
-                continue
+                    # Send message
+                    await self.send_message_with_retry(user, message, result)
+                    self._last_rpc = asyncio.get_running_loop().time()
+                    
+                    await asyncio.to_thread(self.record_progress, result)
+                    processed_users.add(user)
+                    
+                    processed += 1
+                    if processed % 10 == 0:
+                        self.print_stats(processed, self.stats['total'])
+                        
+                except Exception as e:
+                    self.logger.error("Unexpected error processing %s: %s", user, e)
+                finally:
+                    resolving.cancel()  # No-op unless the wait was interrupted
+
+        await asyncio.to_thread(self.open_journal)
+        tasks = [asyncio.create_task(producer())]
+        tasks += [asyncio.create_task(worker()) for _ in range(workers)]
+        # Runs until cancelled, so it stays out of the gather below
+        pinger = asyncio.create_task(self.keep_alive())
+        try:
+            await asyncio.gather(*tasks)
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            self.logger.info("Process interrupted by user")
+        except Exception as e:
+            self.logger.error(f"Error feeding users to workers: {e}")
+        finally:
+            # Stop whatever is still running before the journals are closed
+            for task in (*tasks, pinger):
+                task.cancel()
+            await asyncio.gather(*tasks, pinger, return_exceptions=True)
+            await asyncio.to_thread(self.close_journal)
+            await asyncio.to_thread(processed_users.close)
+            if processed_index is not None:
+                processed_index.close()
+            await asyncio.to_thread(self.save_entity_cache)
         
-        # Final save and statistics
-        self.save_progress(sent_users, failed_users)
-        self.print_final_stats(start_time)
+        # Final statistics
+        self.print_final_stats()
 
-    def print_stats(self, current: int, total: int, start_time: datetime):
+    def print_stats(self, current: int, total: int):
         """Print current statistics"""
-        elapsed = datetime.now() - start_time
-        rate = current / elapsed.total_seconds() * 60 if elapsed.total_seconds() > 0 else 0
+        elapsed = time.monotonic() - self._t0
+        rate = current / elapsed * 60 if elapsed > 0 else 0
         eta = timedelta(seconds=(total - current) * self.config.message_delay)
+        progress = current / total * 100 if total else 0
         
-        print(f"\n{'='*50}")
-        print(f"Progress: {current}/{total} ({current/total*100:.1f}%)")
-        print(f"Sent: {self.stats['sent']}")
-        print(f"Failed: {self.stats['failed']}")
-        print(f"Skipped: {self.stats['skipped']}")
-        print(f"Rate: {rate:.1f} messages/minute")
-        print(f"ETA: {eta}")
-        print(f"{'='*50}\n")
-
-    def print_final_stats(self, start_time: datetime):
+        self.write_stats(
+            f"\n{'='*50}\n"
+            f"Progress: {current}/{total} ({progress:.1f}%)\n"
+            f"Sent: {self.stats['sent']}\n"
+            f"Failed: {self.stats['failed']}\n"
+            f"Skipped: {self.stats['skipped']}\n"
+            f"Rate: {rate:.1f} messages/minute\n"
+            f"ETA: {eta}\n"
+            f"{'='*50}\n\n"
+        )
+
+    def print_final_stats(self):
         """Print final statistics"""
-        elapsed = datetime.now() - start_time
-        print(f"\n{'='*60}")
-        print(f"BULK MESSAGING COMPLETED")
-        print(f"{'='*60}")
-        print(f"Total processed: {self.stats['total']}")
-        print(f"Successfully sent: {self.stats['sent']}")
-        print(f"Failed: {self.stats['failed']}")
-        print(f"Skipped: {self.stats['skipped']}")
-        print(f"Total time: {elapsed}")
-        print(f"Success rate: {self.stats['sent']/self.stats['total']*100:.1f}%")
-        print(f"{'='*60}")
+        elapsed = timedelta(seconds=time.monotonic() - self._t0)
+        success_rate = self.stats['sent'] / self.stats['total'] * 100 if self.stats['total'] else 0
+        self.write_stats(
+            f"\n{'='*60}\n"
+            f"BULK MESSAGING COMPLETED\n"
+            f"{'='*60}\n"
+            f"Total processed: {self.stats['total']}\n"
+            f"Successfully sent: {self.stats['sent']}\n"
+            f"Failed: {self.stats['failed']}\n"
+            f"Skipped: {self.stats['skipped']}\n"
+            f"Total time: {elapsed}\n"
+            f"Success rate: {success_rate:.1f}%\n"
+            f"{'='*60}\n",
+            # The summary survives LOG_LEVEL=WARNING; only the periodic block follows the level
+            level=logging.WARNING
+        )
+
+    def write_stats(self, text: str, level: int = logging.INFO):
+        """Write a stats block in one call, or log it at level when stdout is not a terminal"""
+        if sys.stdout.isatty():
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        else:
+            self.logger.log(level, text.strip('\n'))
 
 async def main():
     """Main function"""
     # Load configuration
     config = Config(
-        api_id=int(os.getenv('TELEGRAM_API_ID', '0')),
-        api_hash=os.getenv('TELEGRAM_API_HASH', ''),
-        phone_number=os.getenv('TELEGRAM_PHONE', ''),
+        api_id=int(TELEGRAM_API_ID),
+        api_hash=TELEGRAM_API_HASH,
+        phone_number=TELEGRAM_PHONE,
         message_delay=60  # 1 minute between messages
     )
     
@@ -293,10 +897,12 @@ async def main():
         sender.logger.info("Connected to Telegram successfully")
         
         # Load users and message
-        users = sender.load_users_from_csv('data/users.csv')
-        message = sender.load_message_template('data/message.txt')
+        # Counting pass only; users are streamed again while sending
+        total = await asyncio.to_thread(sum, (1 for _ in sender.iter_users_from_csv(USERS_CSV)))
+        sender.logger.info(f"Loaded {total} users from {USERS_CSV}")
+        message = await asyncio.to_thread(sender.load_message_template, 'data/message.txt')
         
-        if not users:
+        if not total:
             sender.logger.error("No users loaded")
             return
             
@@ -308,21 +914,22 @@ async def main():
         resume = input("Do you want to resume from previous progress? (y/n): ").lower() == 'y'
         
         # Confirm before starting
-        print(f"\nReady to send messages to {len(users)} users")
-        print(f"Message preview: {message[:100]}...")
-        print(f"Rate limit: 1 message per {config.message_delay} seconds")
+        print(f"\nReady to send messages to {total} users")
+        print(f"Message preview: {message.text[:100]}...")
+        print(f"Rate limit: 1 message per {config.message_delay} seconds across {config.workers} workers")
         
         if input("\nProceed? (y/n): ").lower() != 'y':
             print("Operation cancelled")
             return
         
         # Start bulk messaging
-        await sender.send_bulk_messages(users, message, resume)
+        await sender.send_bulk_messages(sender.iter_users_from_csv(USERS_CSV), message, resume, total)
         
     except Exception as e:
         sender.logger.error(f"Fatal error: {e}")
     finally:
         await sender.client.disconnect()
+        sender.log_listener.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file